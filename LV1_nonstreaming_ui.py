@@ -1,10 +1,12 @@
-﻿from typing import Dict, Generator, List
+﻿import argparse
+from typing import AsyncGenerator, Dict, List, Optional
 
 import gradio as gr
 from azure.ai.ml import MLClient
 
 from src.chat import AISimpleResponse, BaseChatApp
 from src.initializer import initialize_client
+from src.semantic_cache import Embedder
 from src.utils import log_message
 
 
@@ -14,10 +16,18 @@ class ChatApp(BaseChatApp):
         ml_client: MLClient,
         endpoint_name: str,
         deployment_name: str,
+        embedder: Optional[Embedder] = None,
+        use_endpoint_cache: bool = False,
     ):
-        super().__init__(ml_client, endpoint_name, deployment_name)
+        super().__init__(
+            ml_client,
+            endpoint_name,
+            deployment_name,
+            embedder,
+            use_endpoint_cache,
+        )
 
-    def respond_stream(self) -> Generator[AISimpleResponse, None, None]:
+    async def respond_stream(self) -> AsyncGenerator[AISimpleResponse, None]:
         pass
 
     def respond_simple(
@@ -77,6 +87,14 @@ class ChatApp(BaseChatApp):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--endpoint-cache",
+        action="store_true",
+        help="Cache the endpoint URL and key on disk for an hour, to skip the Azure ML lookups on restart",
+    )
+    args = parser.parse_args()
+
     ml_client, endpoint_name, deployment_name = initialize_client(
         filename=".env"
     )
@@ -86,6 +104,7 @@ if __name__ == "__main__":
         ml_client=ml_client,
         endpoint_name=endpoint_name,
         deployment_name=deployment_name,
+        use_endpoint_cache=args.endpoint_cache,
     )
 
     # NOTE: launch ui
@@ -114,3 +133,4 @@ if __name__ == "__main__":
         )
 
     demo.launch()
+    chat_app.close()
@@ -1,12 +1,12 @@
-﻿import time
-from typing import Dict, Generator, List
+﻿import argparse
+from typing import AsyncGenerator, Dict, List, Optional
 
 import gradio as gr
 from azure.ai.ml import MLClient
-from rich import print
 
-from src.chat import AISimpleResponse, BaseChatApp
+from src.chat import AISimpleResponse, AIStreamResult, BaseChatApp
 from src.initializer import initialize_client
+from src.semantic_cache import Embedder
 from src.utils import log_message
 
 
@@ -16,19 +16,28 @@ class ChatApp(BaseChatApp):
         ml_client: MLClient,
         endpoint_name: str,
         deployment_name: str,
+        embedder: Optional[Embedder] = None,
+        use_endpoint_cache: bool = False,
     ):
-        super().__init__(ml_client, endpoint_name, deployment_name)
+        super().__init__(
+            ml_client,
+            endpoint_name,
+            deployment_name,
+            embedder,
+            use_endpoint_cache,
+        )
 
     def respond_simple(self) -> AISimpleResponse:
         pass
 
-    def respond_stream(
+    async def respond_stream(
         self,
         msg: str,
         chat_history: List[Dict[str, str | Dict]],
         chat_history_for_ml: List[Dict[str, str]],
         delay: float = 0.01,
-    ) -> Generator[AISimpleResponse, None, None]:
+        simulate_stream: bool = False,
+    ) -> AsyncGenerator[AISimpleResponse, None]:
         """Processes Non-Streaming chat messages in Gradio chatbot. This method must be implemented by subclasses.
 
         Args:
@@ -41,19 +50,59 @@ class ChatApp(BaseChatApp):
                 The Format is `[ {"inputs": {"question": "<USER MESSAGE1>"}, "outputs": "<RESPONSE MESSAGE1>"},
                     {"inputs": {"question": "<USER MESSAGE2>"}, "outputs": "<RESPONSE MESSAGE2>"},・・・]`
 
+            delay (float): Processing Interval of output message, only used when `simulate_stream` is True.
+            simulate_stream (bool): Replay a non-streaming API answer character by character instead of streaming it from the endpoint.
+
         Returns:
             (AISimpleResponse): The updated message, chat history, and ML chat history.
         """
         log_message(f"Calling ML OnlineEndpoint...")
 
-        if not (
-            result := self.exec_api(
-                msg=msg, chat_history_for_ml=chat_history_for_ml
+        result = AIStreamResult()
+        stream = self._prefetch(
+            self.asimulate_stream(
+                msg=msg,
+                chat_history_for_ml=chat_history_for_ml,
+                delay=delay,
+                result=result,
             )
-        ):
+            if simulate_stream
+            else self.aexec_api_stream(
+                msg=msg, chat_history_for_ml=chat_history_for_ml, result=result
+            )
+        )
+
+        # NOTE: List of ChatHistory Json for *Azure OpenAI*
+        chat_history.append({"role": "user", "content": msg})
+        streaming_entry: Dict[str, str] = {"role": "assistant", "content": ""}
+        chat_history.append(streaming_entry)
+
+        # NOTE: skip validation on the hot path, the fields are ours. The
+        #       frame only references the history, so one object serves all
+        frame = AISimpleResponse.model_construct(
+            bot_message="",
+            chat_history=chat_history,
+            chat_history_for_ml=chat_history_for_ml,
+        )
+
+        # NOTE: fill the appended entry in place, instead of rebuilding the
+        #       history per chunk (chunks are already batched at the source)
+        has_chunk = False
+        async for message, _, _ in stream:
+            # NOTE: a chunk is shown once the next one arrives, the last one
+            #       by the final response below, so no frame is sent twice
+            if has_chunk:
+                yield frame
+            streaming_entry["content"] += message or ""
+            has_chunk = True
+
+        # NOTE: a stream that broke off midway leaves a truncated answer,
+        #       don't keep it as a turn of the conversation
+        if not (bot_message := streaming_entry["content"]) or not result.ok:
             log_message(
                 "No valid response received from the API.", level="error"
             )
+            del chat_history[-2:]
 
             yield AISimpleResponse(
                 bot_message="",
@@ -63,13 +112,6 @@ class ChatApp(BaseChatApp):
 
             return
 
-        res_json, _, _ = result
-        bot_message: str = res_json.get("answer", "<EMPTY>")
-
-        # NOTE: List of ChatHistory Json for *Azure OpenAI*
-        chat_history.append({"role": "user", "content": msg})
-        chat_history.append({"role": "assistant", "content": bot_message})
-
         # NOTE: LIST of ChatHistory Json for *MLAPI*.
         chat_history_for_ml.append(
             {
@@ -78,19 +120,24 @@ class ChatApp(BaseChatApp):
             }
         )
 
-        # NOTE: intetionally run `for` Loop to behave like streaming Chat
-        response: Dict[str, str] = {"role": "assistant", "content": ""}
-        for message in bot_message:
-            time.sleep(delay)
-            response["content"] += message or ""
-            yield AISimpleResponse(
-                bot_message="",
-                chat_history=chat_history[:-1] + [response],
-                chat_history_for_ml=chat_history_for_ml,
-            )
+        yield AISimpleResponse(
+            bot_message="",
+            chat_history=chat_history,
+            chat_history_for_ml=chat_history_for_ml,
+        )
 
 
 if __name__ == "__main__":
+    from rich import print
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--endpoint-cache",
+        action="store_true",
+        help="Cache the endpoint URL and key on disk for an hour, to skip the Azure ML lookups on restart",
+    )
+    args = parser.parse_args()
+
     ml_client, endpoint_name, deployment_name = initialize_client(
         filename=".env"
     )
@@ -100,6 +147,7 @@ if __name__ == "__main__":
         ml_client=ml_client,
         endpoint_name=endpoint_name,
         deployment_name=deployment_name,
+        use_endpoint_cache=args.endpoint_cache,
     )
 
     # NOTE: launch ui
@@ -111,14 +159,14 @@ if __name__ == "__main__":
         clear = gr.ClearButton([msg, chat_history])
 
         # Handler for gradio button trigger function
-        def handle_response(msg, chat_history, chat_history_for_ml):
+        async def handle_response(msg, chat_history, chat_history_for_ml):
             print(f"chat_history: {chat_history}")
             response_generator = chat_app.respond_stream(
                 msg, chat_history, chat_history_for_ml
             )
 
             # process each response from generator
-            for response in response_generator:
+            async for response in response_generator:
                 yield response.bot_message, response.chat_history, response.chat_history_for_ml
 
         msg.submit(
@@ -128,3 +176,4 @@ if __name__ == "__main__":
         )
 
     demo.launch()
+    chat_app.close()
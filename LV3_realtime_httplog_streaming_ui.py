@@ -1,14 +1,24 @@
-﻿import time
+﻿import argparse
 from pathlib import Path
-from typing import Dict, Generator, List
+from typing import AsyncGenerator, Dict, List, Optional
 
 import gradio as gr
 from azure.ai.ml import MLClient
-from rich import print
 
-from src.chat import AICustomResponse, AISimpleResponse, BaseChatApp
+from src.chat import (
+    AICustomResponse,
+    AISimpleResponse,
+    AIStreamResult,
+    BaseChatApp,
+)
 from src.initializer import initialize_client
-from src.utils import create_http_log, format_http_log, log_message
+from src.semantic_cache import Embedder
+from src.utils import (
+    create_http_log,
+    format_http_log,
+    http_log_enabled,
+    log_message,
+)
 
 
 class ChatApp(BaseChatApp):
@@ -17,13 +27,21 @@ class ChatApp(BaseChatApp):
         ml_client: MLClient,
         endpoint_name: str,
         deployment_name: str,
+        embedder: Optional[Embedder] = None,
+        use_endpoint_cache: bool = False,
     ):
-        super().__init__(ml_client, endpoint_name, deployment_name)
+        super().__init__(
+            ml_client,
+            endpoint_name,
+            deployment_name,
+            embedder,
+            use_endpoint_cache,
+        )
 
     def respond_simple(self) -> AISimpleResponse:
         pass
 
-    def respond_stream(
+    async def respond_stream(
         self,
         msg: str,
         chat_history: List[Dict[str, str | Dict]],
@@ -32,7 +50,8 @@ class ChatApp(BaseChatApp):
         call_log_md_display: str,
         call_count: int,
         delay: float = 0.01,
-    ) -> Generator[AICustomResponse, None, None]:
+        simulate_stream: bool = False,
+    ) -> AsyncGenerator[AICustomResponse, None]:
         """Processes Non-Streaming chat messages in Gradio chatbot. This method must be implemented by subclasses.
 
         Args:
@@ -45,7 +64,8 @@ class ChatApp(BaseChatApp):
                 The Format is `[ {"inputs": {"question": "<USER MESSAGE1>"}, "outputs": "<RESPONSE MESSAGE1>"},
                     {"inputs": {"question": "<USER MESSAGE2>"}, "outputs": "<RESPONSE MESSAGE2>"},・・・]`
 
-            delay (float): Processing Interval of output message
+            delay (float): Processing Interval of output message, only used when `simulate_stream` is True.
+            simulate_stream (bool): Replay a non-streaming API answer character by character instead of streaming it from the endpoint.
 
             call_history (gr.State): Past call log.
             call_log_md_display (gr.Markdown): Call log markdown.
@@ -56,44 +76,82 @@ class ChatApp(BaseChatApp):
         """
         log_message(f"Calling ML OnlineEndpoint...")
 
-        if not (
-            result := self.exec_api(
-                msg=msg, chat_history_for_ml=chat_history_for_ml
+        result = AIStreamResult()
+        stream = self._prefetch(
+            self.asimulate_stream(
+                msg=msg,
+                chat_history_for_ml=chat_history_for_ml,
+                delay=delay,
+                result=result,
             )
-        ):
+            if simulate_stream
+            else self.aexec_api_stream(
+                msg=msg, chat_history_for_ml=chat_history_for_ml, result=result
+            )
+        )
+
+        # NOTE: List of ChatHistory Json for *Azure OpenAI*
+        chat_history.append({"role": "user", "content": msg})
+        streaming_entry: Dict[str, str] = {"role": "assistant", "content": ""}
+        chat_history.append(streaming_entry)
+
+        # NOTE: skip validation on the hot path, the fields are ours. The
+        #       frame only references the history, so one object serves all
+        frame = AICustomResponse.model_construct(
+            bot_message="",
+            chat_history=chat_history,
+            chat_history_for_ml=chat_history_for_ml,
+            call_history=call_history,
+            call_log_md_display=call_log_md_display,
+            call_count=call_count,
+        )
+
+        # NOTE: fill the appended entry in place, instead of rebuilding the
+        #       history per chunk (chunks are already batched at the source)
+        has_chunk = False
+        async for message, _, _ in stream:
+            # NOTE: a chunk is shown once the next one arrives, the last one
+            #       by the final response below, so no frame is sent twice
+            if has_chunk:
+                yield frame
+            streaming_entry["content"] += message or ""
+            has_chunk = True
+
+        # NOTE: a stream that broke off midway leaves a truncated answer,
+        #       don't keep it as a turn of the conversation
+        if not (bot_message := streaming_entry["content"]) or not result.ok:
             log_message(
                 "No valid response received from the API.", level="error"
             )
+            del chat_history[-2:]
 
-            yield AISimpleResponse(
+            yield AICustomResponse(
                 bot_message="",
                 chat_history=chat_history,
                 chat_history_for_ml=chat_history_for_ml,
+                call_history=call_history,
+                call_log_md_display=call_log_md_display,
+                call_count=call_count,
             )
 
             return
 
-        res_json, res_status_code, res_status_reason = result
-
-        payload = {"question": msg, "chat_history": chat_history_for_ml}
         call_count += 1
 
-        call_history += create_http_log(
-            call_count=call_count,
-            _cls=self,
-            jinput=payload,
-            joutput=res_json,
-            res_status_code=res_status_code,
-            res_status_reason=res_status_reason,
-        )
-
-        call_log_md_display = format_http_log(call_history=call_history)
+        # NOTE: skip rebuilding the payload when the log isn't rendered
+        if http_log_enabled():
+            call_history += create_http_log(
+                call_count=call_count,
+                _cls=self,
+                jinput=self.build_payload(msg, chat_history_for_ml),
+                joutput=result.res_json,
+                res_status_code=result.status_code,
+                res_status_reason=result.status_reason,
+                accept=result.accept,
+                content_type=result.content_type,
+            )
 
-        bot_message: str = res_json.get("answer", "<EMPTY>")
-
-        # NOTE: List of ChatHistory Json for *Azure OpenAI*
-        chat_history.append({"role": "user", "content": msg})
-        chat_history.append({"role": "assistant", "content": bot_message})
+            call_log_md_display = format_http_log(call_history=call_history)
 
         # NOTE: LIST of ChatHistory Json for *MLAPI*.
         chat_history_for_ml.append(
@@ -103,22 +161,25 @@ class ChatApp(BaseChatApp):
             }
         )
 
-        # NOTE: intetionally run `for` Loop to behave like streaming Chat
-        response: Dict[str, str] = {"role": "assistant", "content": ""}
-        for message in bot_message:
-            time.sleep(delay)
-            response["content"] += message or ""
-            yield AICustomResponse(
-                bot_message="",
-                chat_history=chat_history[:-1] + [response],
-                chat_history_for_ml=chat_history_for_ml,
-                call_history=call_history,
-                call_log_md_display=call_log_md_display,
-                call_count=call_count,
-            )
+        yield AICustomResponse(
+            bot_message="",
+            chat_history=chat_history,
+            chat_history_for_ml=chat_history_for_ml,
+            call_history=call_history,
+            call_log_md_display=call_log_md_display,
+            call_count=call_count,
+        )
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--endpoint-cache",
+        action="store_true",
+        help="Cache the endpoint URL and key on disk for an hour, to skip the Azure ML lookups on restart",
+    )
+    args = parser.parse_args()
+
     ml_client, endpoint_name, deployment_name = initialize_client(
         filename=".env"
     )
@@ -128,6 +189,7 @@ if __name__ == "__main__":
         ml_client=ml_client,
         endpoint_name=endpoint_name,
         deployment_name=deployment_name,
+        use_endpoint_cache=args.endpoint_cache,
     )
 
     with (Path(__file__).parent / "assets" / "main.css").open(
@@ -169,7 +231,7 @@ if __name__ == "__main__":
         )
 
         # Handler for gradio button trigger function
-        def handle_response(
+        async def handle_response(
             msg,
             chat_history,
             chat_history_for_ml,
@@ -187,8 +249,17 @@ if __name__ == "__main__":
             )
 
             # process each response from generator
-            for response in response_generator:
-                yield response.bot_message, response.chat_history, response.chat_history_for_ml, response.call_history, response.call_log_md_display, response.call_count,
+            async for response in response_generator:
+                # NOTE: the log HTML only changes once per call, don't resend
+                #       it with every streamed frame
+                if response.call_log_md_display == call_log_md_display:
+                    call_log_update = gr.update()
+                else:
+                    call_log_update = call_log_md_display = (
+                        response.call_log_md_display
+                    )
+
+                yield response.bot_message, response.chat_history, response.chat_history_for_ml, response.call_history, call_log_update, response.call_count,
 
         msg.submit(
             fn=handle_response,
@@ -211,3 +282,4 @@ if __name__ == "__main__":
         )
 
     demo.launch(debug=True)
+    chat_app.close()
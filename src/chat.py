@@ -1,12 +1,43 @@
-﻿from abc import ABC, abstractmethod
-from typing import Dict, Generator, List, Union
+﻿import asyncio
+import hashlib
+import importlib.util
+import json
+import threading
+from abc import ABC, abstractmethod
+from typing import (
+    TYPE_CHECKING,
+    AsyncGenerator,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 from urllib.parse import urlparse
 
+import httpx
 import requests
-from azure.ai.ml import MLClient
 from pydantic import BaseModel
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
-from src.utils import log_message, show_ml_info
+from src import endpoint_cache
+from src.utils import (
+    json_dumps,
+    json_loads,
+    log_enabled,
+    log_message,
+    show_ml_info,
+)
+
+if TYPE_CHECKING:
+    import numpy as np
+    from azure.ai.ml import MLClient
+
+    from src.semantic_cache import Embedder
+
+# NOTE: Promptflow streams its answer only when asked for Server-Sent Events
+_STREAM_ACCEPT = "text/event-stream, application/json"
 
 
 class AISimpleResponse(BaseModel):
@@ -24,8 +55,10 @@ class AISimpleResponse(BaseModel):
     """
 
     bot_message: str
-    chat_history: List[Dict[str, str | Dict]]
-    chat_history_for_ml: List[Dict[str, str | Dict]]
+    # NOTE: plain `list`, so Pydantic doesn't re-validate every history
+    #       message on each streamed frame
+    chat_history: list
+    chat_history_for_ml: list
 
 
 class AICustomResponse(BaseModel):
@@ -47,20 +80,97 @@ class AICustomResponse(BaseModel):
     """
 
     bot_message: str
-    chat_history: List[Dict[str, str | Dict]]
-    chat_history_for_ml: List[Dict[str, str | Dict]]
+    # NOTE: plain `list`, so Pydantic doesn't re-validate every history
+    #       message on each streamed frame
+    chat_history: list
+    chat_history_for_ml: list
 
     call_history: str
     call_log_md_display: str
     call_count: int
 
 
+class AIStreamResult(BaseModel):
+    """Represent the outcome of a streamed API call, filled in once the stream ends
+
+    Args:
+        ok (bool): True only if the whole answer was received.
+        res_json (Optional[Dict]): Response JSON. For a Server-Sent Events stream, the events merged into one, with the `answer` chunks concatenated.
+        status_code (Optional[int]): HTTP status code.
+        status_reason (Optional[str]): HTTP status reason message.
+        accept (str): Accept header sent with the request.
+        content_type (str): Content-Type header of the response.
+    """
+
+    ok: bool = False
+    res_json: Optional[dict] = None
+    status_code: Optional[int] = None
+    status_reason: Optional[str] = None
+    accept: str = "application/json"
+    content_type: str = "application/json"
+
+
+class _StreamFlight:
+    def __init__(
+        self,
+        stream: AsyncGenerator[Tuple[str, int, str], None],
+        result: AIStreamResult,
+    ) -> None:
+        """One in-flight stream, replayed to every caller that follows it.
+
+        Args:
+            stream (AsyncGenerator[Tuple[str, int, str], None]): Stream from `_aexec_api_stream()`, filling in `result`.
+            result (AIStreamResult): Outcome of the stream, shared by all followers.
+        """
+        self.result = result
+        self._chunks: List[Tuple[str, int, str]] = []
+        self._done = False
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._run(stream))
+
+    async def _run(self, stream: AsyncGenerator) -> None:
+        try:
+            async for chunk in stream:
+                self._chunks.append(chunk)
+                self._notify()
+        except Exception as e:
+            log_message(f"error: {e}", level="error")
+        finally:
+            self._done = True
+            self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self) -> AsyncGenerator[Tuple[str, int, str], None]:
+        """Yields every chunk of the stream from the start, including those received before joining."""
+        i = 0
+        while True:
+            # NOTE: take the event before draining, so a chunk appended while
+            #       this caller is suspended in `yield` still wakes it up
+            changed = self._changed
+            while i < len(self._chunks):
+                yield self._chunks[i]
+                i += 1
+            if self._done:
+                return
+            await changed.wait()
+
+
 class BaseChatApp(ABC):
+    # NOTE: number of past turns sent to the ML Endpoint, keeps the payload
+    #       (and the upstream prompt) from growing with the conversation
+    history_window: int = 8
+
     def __init__(
         self,
-        ml_client: MLClient,
+        ml_client: "MLClient",
         endpoint_name: str,
         deployment_name: str,
+        embedder: Optional["Embedder"] = None,
+        use_endpoint_cache: bool = False,
+        verbose: bool = True,
     ) -> None:
         """Initializes the ChatApp with Azure Machine Learning client and endpoint information.
 
@@ -68,33 +178,157 @@ class BaseChatApp(ABC):
             ml_client (MLClient): The Azure Machine Learning client.
             endpoint_name (str): Name of the online endpoint.
             deployment_name (str): Name of the deployment in the endpoint.
+            embedder (Optional[Embedder]): Embedding model for the semantic response cache. The cache is disabled when None.
+            use_endpoint_cache (bool): Reuse endpoint info cached by a previous run instead of querying Azure ML. Off by default, since the cache file holds the endpoint key in plain text.
+            verbose (bool): Show the ML workspace info at console.
         """
 
+        self._ml_client = ml_client
+        self._use_endpoint_cache = use_endpoint_cache
+
         log_message("Getting endpoint info...")
         self.setup_endpoint(ml_client, endpoint_name)
 
         log_message("Validating Deployment info...")
         self.setup_deployment(ml_client, deployment_name)
 
+        self.setup_headers()
+
+        # NOTE: pooled session, so each turn skips the TCP/TLS handshake
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=2,
+                backoff_factor=0.2,
+                status_forcelist=[429, 502, 503, 504],
+                allowed_methods=frozenset({"POST"}),
+                raise_on_status=False,
+            ),
+        )
+        self._session.mount("https://", adapter)
+
+        self._session.headers.update(self._headers)
+        self.setup_request()
+        self._refresh_lock = threading.Lock()
+
+        # NOTE: shared async client, so streaming UIs don't block Gradio's loop
+        # NOTE: HTTP/2 multiplexes concurrent calls over one socket, if `h2` is
+        #       installed (it falls back to HTTP/1.1 keep-alive otherwise)
+        self._aclient = httpx.AsyncClient(
+            http2=importlib.util.find_spec("h2") is not None,
+            headers=self._headers,
+            limits=httpx.Limits(
+                max_connections=64, max_keepalive_connections=16
+            ),
+            timeout=httpx.Timeout(30.0, connect=3.0),
+        )
+        self._arefresh_lock = asyncio.Lock()
+
+        # NOTE: serve paraphrased repeats without calling the ML Endpoint
+        self._embedder = None
+        if embedder is not None:
+            # NOTE: imported here, so numpy only loads when the cache is used
+            from src.semantic_cache import CachedEmbedder, SemanticCache
+
+            self._embedder = CachedEmbedder(embedder, cap=10_000)
+            self._sem_cache = SemanticCache(max_size=1024, tau=0.85)
+
+        # NOTE: identical in-flight API calls, shared by concurrent callers
+        self._inflight: Dict[bytes, asyncio.Task] = {}
+        self._inflight_streams: Dict[bytes, _StreamFlight] = {}
+
         # showing ml workspace info at console
-        show_ml_info(ml_client, self._endpoint_url, self._deployment_name)
+        if verbose:
+            show_ml_info(
+                ml_client, self._endpoint_url, self._deployment_name
+            )
 
-    def setup_endpoint(self, ml_client: MLClient, endpoint_name: str):
+    def close(self) -> None:
+        """Releases the pooled HTTP connections to the ML Endpoint, of both the sync and the async client."""
+        self._session.close()
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None:
+            loop.create_task(self.aclose())
+            return
+
+        # NOTE: e.g. after `demo.launch()` returned, Gradio's loop is gone
+        try:
+            asyncio.run(self.aclose())
+        except RuntimeError as e:
+            # NOTE: connections still bound to the closed loop can't be shut
+            #       down gracefully, their sockets go with the transports
+            log_message(f"Closed the async client uncleanly: {e}")
+
+    async def aclose(self) -> None:
+        """Releases the pooled async HTTP connections to the ML Endpoint."""
+        await self._aclient.aclose()
+
+    def setup_endpoint(self, ml_client: "MLClient", endpoint_name: str):
+        self._endpoint_name = endpoint_name
+        self._endpoint_cache_path = endpoint_cache.cache_path(
+            ml_client.subscription_id,
+            ml_client.resource_group_name,
+            ml_client.workspace_name,
+            endpoint_name,
+        )
+
+        # NOTE: skip the ARM round trips while a previous run's info is fresh
+        if self._use_endpoint_cache and (
+            cached := endpoint_cache.load(self._endpoint_cache_path)
+        ):
+            log_message("Using cached endpoint info...")
+            self._apply_endpoint_info(cached)
+        else:
+            self._apply_endpoint_info(
+                self._fetch_endpoint_info(ml_client, endpoint_name)
+            )
+
+    def _fetch_endpoint_info(
+        self, ml_client: "MLClient", endpoint_name: str
+    ) -> Dict[str, str]:
+        """Queries Azure ML for the scoring URI and key, without touching the request state.
+
+        Args:
+            ml_client (MLClient): The Azure Machine Learning client.
+            endpoint_name (str): Name of the online endpoint.
+
+        Returns:
+            Dict[str, str]: `{"url": ..., "auth_mode": ..., "key": ...}`
+        """
         try:
             endpoint = ml_client.online_endpoints.get(endpoint_name)
             keys = ml_client.online_endpoints.get_keys(endpoint_name)
         except Exception as e:
             log_message(
-                f"Failed to retrieve endpoint information: {e}", level="error"
+                f"Failed to retrieve endpoint information: {e}",
+                level="error",
             )
             raise
 
-        self._endpoint_url = endpoint.scoring_uri
-        self._endpoint_key = (
-            keys.primary_key
-            if endpoint.auth_mode == "key"
-            else keys.access_token
-        )
+        endpoint_info = {
+            "url": endpoint.scoring_uri,
+            "auth_mode": endpoint.auth_mode,
+            "key": (
+                keys.primary_key
+                if endpoint.auth_mode == "key"
+                else keys.access_token
+            ),
+        }
+        if self._use_endpoint_cache:
+            endpoint_cache.save(self._endpoint_cache_path, endpoint_info)
+
+        return endpoint_info
+
+    def _apply_endpoint_info(self, endpoint_info: Dict[str, str]) -> None:
+        self._endpoint_info = endpoint_info
+        self._endpoint_url = endpoint_info["url"]
+        self._endpoint_key = endpoint_info["key"]
 
         parsed_url = urlparse(self._endpoint_url)
         self.protocol, self.host, self.path = (
@@ -103,9 +337,7 @@ class BaseChatApp(ABC):
             parsed_url.path,
         )
 
-        self._endpoint_name = endpoint_name
-
-    def setup_deployment(self, ml_client: MLClient, deployment_name: str):
+    def setup_deployment(self, ml_client: "MLClient", deployment_name: str):
         """Function to validating ML Endpoint's Deployment Name
 
         Args:
@@ -114,6 +346,9 @@ class BaseChatApp(ABC):
         """
         self._deployment_name = deployment_name
 
+        if self._endpoint_info.get("deployment") == deployment_name:
+            return
+
         try:
             _ = ml_client.online_deployments.get(
                 name=self._deployment_name, endpoint_name=self._endpoint_name
@@ -125,61 +360,508 @@ class BaseChatApp(ABC):
             )
             raise
 
-    def exec_api(
+        if self._use_endpoint_cache:
+            self._endpoint_info["deployment"] = deployment_name
+            endpoint_cache.save(self._endpoint_cache_path, self._endpoint_info)
+
+    def setup_headers(self):
+        """Function to build the request headers once, instead of per API call"""
+        self._headers: Dict[str, str] = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self._endpoint_key}",
+            "azureml-model-deployment": self._deployment_name,
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+        }
+
+    def setup_request(self):
+        """Function to parse the endpoint URL and prepare the request template once, instead of per API call"""
+        self._prepared_request = self._session.prepare_request(
+            requests.Request("POST", self._endpoint_url)
+        )
+        self._send_kwargs = self._session.merge_environment_settings(
+            self._endpoint_url, {}, None, None, None
+        )
+        self._endpoint_httpx_url = httpx.URL(self._endpoint_url)
+
+    def refresh_key(self) -> None:
+        """Re-fetches the endpoint key (e.g. after a key rotation) and updates the request headers."""
+        endpoint_cache.invalidate(self._endpoint_cache_path)
+        self._apply_key(
+            self._fetch_endpoint_info(self._ml_client, self._endpoint_name)
+        )
+
+    async def arefresh_key(self) -> None:
+        """Same as `refresh_key`, with the Azure ML round trips in a worker thread.
+
+        The request state is only swapped on the event loop, so concurrent
+        coroutines never see it half updated.
+        """
+        endpoint_cache.invalidate(self._endpoint_cache_path)
+        self._apply_key(
+            await asyncio.to_thread(
+                self._fetch_endpoint_info, self._ml_client, self._endpoint_name
+            )
+        )
+
+    def _apply_key(self, endpoint_info: Dict[str, str]) -> None:
+        self._apply_endpoint_info(endpoint_info)
+        self.setup_headers()
+        self._session.headers.update(self._headers)
+        self._aclient.headers.update(self._headers)
+        self.setup_request()
+
+    def build_payload(
         self, msg: str, chat_history_for_ml: List[Dict[str, str]]
-    ) -> Union[Dict[str, str], None]:
-        """Executes the API call.
+    ) -> Dict[str, Union[str, List[Dict[str, str]]]]:
+        """Function to build the ML Endpoint payload from the last `history_window` turns
 
         Args:
             msg (str): User question message
             chat_history_for_ml (List[Dict[str, str | Dict]]): ChatHistory Json for MLAPI. The Format is `{ "inputs": {"question": msg}, "outputs": bot_message }`
 
         Returns:
-            tuple ( Union[Dict[str, str], None], int, str ): ("None" | "Result JSON for MLAPI". The Format is `{ "answer", "<HERE RESPONSE MESSAGE>" }`, status_code, status_reason_msg)
+            Dict[str, Union[str, List[Dict[str, str]]]]: The Format is `{ "question": msg, "chat_history": chat_history_for_ml }`
         """
+        start = max(len(chat_history_for_ml) - self.history_window, 0)
+
         # ML Endpoint Payload example
-        payload: Dict[str, Union[str, List[Dict[str, str]]]] = {
+        return {
             "question": msg,
-            "chat_history": chat_history_for_ml,
+            "chat_history": chat_history_for_ml[start:],
         }
 
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self._endpoint_key}",
-            "azureml-model-deployment": self._deployment_name,
-            "Accept": "application/json",
-        }
+    def _send(self, payload: Dict) -> requests.Response:
+        """Posts `payload`, refreshing the endpoint key once if it was rejected.
 
-        response = requests.post(
-            self._endpoint_url,
-            json=payload,
-            headers=headers,
+        If the refresh itself fails, the 401 response is returned.
+        """
+        body = json_dumps(payload)
+        for retry in (True, False):
+            sent_key = self._endpoint_key
+            request = self._prepared_request.copy()
+            request.prepare_body(data=body, files=None)
+            response = self._session.send(
+                request, timeout=(3.05, 30), **self._send_kwargs
+            )
+            if response.status_code != 401 or not retry:
+                return response
+
+            # NOTE: one refresh at a time, callers rejected with the old key
+            #       meanwhile just retry with the new one
+            with self._refresh_lock:
+                if self._endpoint_key == sent_key:
+                    log_message("Endpoint key was rejected, refreshing it...")
+                    try:
+                        self.refresh_key()
+                    except Exception as e:
+                        log_message(
+                            f"Failed to refresh the endpoint key: {e}",
+                            level="error",
+                        )
+                        return response
+
+    async def _asend(
+        self,
+        payload: Dict,
+        stream: bool = False,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> httpx.Response:
+        """Posts `payload` asynchronously, refreshing the endpoint key once if it was rejected.
+
+        If the refresh itself fails, the 401 response is returned.
+        """
+        body = json_dumps(payload)
+        for retry in (True, False):
+            sent_key = self._endpoint_key
+            request = self._aclient.build_request(
+                "POST",
+                self._endpoint_httpx_url,
+                content=body,
+                headers=headers,
+            )
+            response = await self._aclient.send(request, stream=stream)
+            if response.status_code != 401 or not retry:
+                return response
+
+            # NOTE: one refresh at a time, callers rejected with the old key
+            #       meanwhile just retry with the new one
+            async with self._arefresh_lock:
+                if self._endpoint_key == sent_key:
+                    log_message("Endpoint key was rejected, refreshing it...")
+                    try:
+                        await self.arefresh_key()
+                    except Exception as e:
+                        log_message(
+                            f"Failed to refresh the endpoint key: {e}",
+                            level="error",
+                        )
+                        return response
+
+            await response.aclose()
+
+    def _lookup_cache(
+        self, msg: str, chat_history_for_ml: List[Dict[str, str]]
+    ) -> Tuple[Optional["np.ndarray"], Optional[str]]:
+        """Embeds the question and looks it up in the semantic response cache.
+
+        Args:
+            msg (str): User question message
+            chat_history_for_ml (List[Dict[str, str | Dict]]): ChatHistory Json for MLAPI.
+
+        Returns:
+            tuple ( Optional[np.ndarray], Optional[str] ): (question embedding, cached answer)
+        """
+        if self._embedder is None:
+            return None, None
+
+        q_emb = self._embedder.embed(msg)
+        return q_emb, self._sem_cache.get(
+            q_emb, namespace=self._cache_namespace(chat_history_for_ml)
         )
 
+    async def _alookup_cache(
+        self, msg: str, chat_history_for_ml: List[Dict[str, str]]
+    ) -> Tuple[Optional["np.ndarray"], Optional[str]]:
+        if self._embedder is None:
+            return None, None
+
+        # NOTE: embedding is CPU bound, keep it off the event loop
+        return await asyncio.to_thread(
+            self._lookup_cache, msg, chat_history_for_ml
+        )
+
+    def _store_cache(
+        self,
+        q_emb: Optional["np.ndarray"],
+        chat_history_for_ml: List[Dict[str, str]],
+        answer: Optional[str],
+    ) -> None:
+        if q_emb is not None and answer:
+            self._sem_cache.put(
+                q_emb,
+                answer,
+                namespace=self._cache_namespace(chat_history_for_ml),
+            )
+
+    @staticmethod
+    def _cache_namespace(chat_history_for_ml: List[Dict[str, str]]) -> str:
+        # NOTE: answers depend on the conversation, never share them across it
+        return hashlib.sha256(repr(chat_history_for_ml).encode()).hexdigest()
+
+    def exec_api(
+        self, msg: str, chat_history_for_ml: List[Dict[str, str]]
+    ) -> Union[Dict[str, str], None]:
+        """Executes the API call.
+
+        Args:
+            msg (str): User question message
+            chat_history_for_ml (List[Dict[str, str | Dict]]): ChatHistory Json for MLAPI. The Format is `{ "inputs": {"question": msg}, "outputs": bot_message }`
+
+        Returns:
+            tuple ( Union[Dict[str, str], None], int, str ): ("None" | "Result JSON for MLAPI". The Format is `{ "answer", "<HERE RESPONSE MESSAGE>" }`, status_code, status_reason_msg)
+        """
+        q_emb, hit = self._lookup_cache(msg, chat_history_for_ml)
+        if hit is not None:
+            return ({"answer": hit}, 200, "OK (semcache)")
+
+        payload = self.build_payload(msg, chat_history_for_ml)
+
         try:
+            response = self._send(payload)
             response.raise_for_status()
-            log_message(
-                f"Got response: {response.status_code} {response.reason}"
-            )
-            content_type = response.headers.get("Content-Type")
-            log_message(f"Response Content-Type: {content_type}")
+            if log_enabled("info"):
+                log_message(
+                    f"Got response: {response.status_code} {response.reason}"
+                )
+                content_type = response.headers.get("Content-Type")
+                log_message(f"Response Content-Type: {content_type}")
 
             try:
-                return (
-                    response.json(),
-                    response.status_code,
-                    response.reason,
+                res_json = json_loads(response.content)
+            except json.JSONDecodeError as e:
+                log_message(
+                    f"Failed to parse JSON response: {e}", level="error"
                 )
-            except requests.exceptions.JSONDecodeError as e:
+                return (None, None, None)
+
+            self._store_cache(
+                q_emb, chat_history_for_ml, res_json.get("answer")
+            )
+            return (res_json, response.status_code, response.reason)
+
+        except requests.RequestException as e:
+            log_message(f"error: {e}", level="error")
+            return None
+
+    async def aexec_api(
+        self, msg: str, chat_history_for_ml: List[Dict[str, str]]
+    ) -> Union[Dict[str, str], None]:
+        """Executes the API call without blocking the event loop.
+
+        Concurrent calls with the same question and chat history (e.g. a double
+        click) share a single request to the ML Endpoint.
+
+        Args:
+            msg (str): User question message
+            chat_history_for_ml (List[Dict[str, str | Dict]]): ChatHistory Json for MLAPI. The Format is `{ "inputs": {"question": msg}, "outputs": bot_message }`
+
+        Returns:
+            tuple ( Union[Dict[str, str], None], int, str ): ("None" | "Result JSON for MLAPI". The Format is `{ "answer", "<HERE RESPONSE MESSAGE>" }`, status_code, status_reason_msg)
+        """
+        key = self._inflight_key(msg, chat_history_for_ml)
+
+        # NOTE: no lock needed, nothing is awaited between lookup and insert
+        if (task := self._inflight.get(key)) is None:
+            task = asyncio.ensure_future(
+                self._aexec_api(msg, chat_history_for_ml)
+            )
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        # NOTE: a cancelled caller must not cancel the call the others wait on
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def _inflight_key(
+        msg: str, chat_history_for_ml: List[Dict[str, str]]
+    ) -> bytes:
+        return hashlib.blake2b(
+            msg.encode() + b"|" + repr(chat_history_for_ml).encode(),
+            digest_size=16,
+        ).digest()
+
+    async def _aexec_api(
+        self, msg: str, chat_history_for_ml: List[Dict[str, str]]
+    ) -> Union[Dict[str, str], None]:
+        q_emb, hit = await self._alookup_cache(msg, chat_history_for_ml)
+        if hit is not None:
+            return ({"answer": hit}, 200, "OK (semcache)")
+
+        payload = self.build_payload(msg, chat_history_for_ml)
+
+        try:
+            response = await self._asend(payload)
+            response.raise_for_status()
+            if log_enabled("info"):
+                log_message(
+                    f"Got response: {response.status_code} {response.reason_phrase}"
+                )
+                content_type = response.headers.get("Content-Type")
+                log_message(f"Response Content-Type: {content_type}")
+
+            try:
+                res_json = json_loads(response.content)
+            except json.JSONDecodeError as e:
                 log_message(
                     f"Failed to parse JSON response: {e}", level="error"
                 )
                 return (None, None, None)
 
-        except requests.HTTPError as e:
+            self._store_cache(
+                q_emb, chat_history_for_ml, res_json.get("answer")
+            )
+            return (res_json, response.status_code, response.reason_phrase)
+
+        except httpx.HTTPError as e:
             log_message(f"error: {e}", level="error")
             return None
 
+    async def aexec_api_stream(
+        self,
+        msg: str,
+        chat_history_for_ml: List[Dict[str, str]],
+        result: Optional[AIStreamResult] = None,
+    ) -> AsyncGenerator[Tuple[str, int, str], None]:
+        """Executes the API call and yields the answer as the endpoint streams it.
+
+        Promptflow endpoints stream Server-Sent Events (`data: {"answer": "<TOKEN>"}`)
+        when asked for `text/event-stream`. Endpoints that can't stream answer
+        with plain JSON, which is yielded as a single chunk.
+
+        Concurrent calls with the same question and chat history (e.g. a double
+        click) share a single request to the ML Endpoint, each of them gets all
+        of its chunks.
+
+        Args:
+            msg (str): User question message
+            chat_history_for_ml (List[Dict[str, str | Dict]]): ChatHistory Json for MLAPI. The Format is `{ "inputs": {"question": msg}, "outputs": bot_message }`
+            result (Optional[AIStreamResult]): Filled in with the response JSON and headers. `result.ok` stays False if the stream failed, even after some chunks were yielded.
+
+        Returns:
+            (AsyncGenerator[Tuple[str, int, str], None]): (answer chunk, status_code, status_reason_msg)
+        """
+        key = self._inflight_key(msg, chat_history_for_ml)
+
+        # NOTE: no lock needed, nothing is awaited between lookup and insert
+        if (flight := self._inflight_streams.get(key)) is None:
+            shared = AIStreamResult()
+            flight = _StreamFlight(
+                self._aexec_api_stream(msg, chat_history_for_ml, shared),
+                shared,
+            )
+            self._inflight_streams[key] = flight
+            flight.task.add_done_callback(
+                lambda _: self._inflight_streams.pop(key, None)
+            )
+
+        # NOTE: the request runs in its own task, a caller that stops reading
+        #       doesn't cut it short for the others
+        async for chunk in flight.follow():
+            yield chunk
+
+        if result is not None:
+            for name, value in flight.result:
+                setattr(result, name, value)
+
+    async def _aexec_api_stream(
+        self,
+        msg: str,
+        chat_history_for_ml: List[Dict[str, str]],
+        result: AIStreamResult,
+    ) -> AsyncGenerator[Tuple[str, int, str], None]:
+        q_emb, hit = await self._alookup_cache(msg, chat_history_for_ml)
+        if hit is not None:
+            yield hit, 200, "OK (semcache)"
+            result.res_json = {"answer": hit}
+            result.status_code, result.status_reason = 200, "OK (semcache)"
+            result.ok = True
+            return
+
+        payload = self.build_payload(msg, chat_history_for_ml)
+        result.accept = _STREAM_ACCEPT
+
+        try:
+            response = await self._asend(
+                payload, stream=True, headers={"Accept": _STREAM_ACCEPT}
+            )
+        except httpx.HTTPError as e:
+            log_message(f"error: {e}", level="error")
+            return
+
+        try:
+            response.raise_for_status()
+            content_type = response.headers.get("Content-Type", "")
+            if log_enabled("info"):
+                log_message(
+                    f"Got response: {response.status_code} {response.reason_phrase}"
+                )
+                log_message(f"Response Content-Type: {content_type}")
+
+            status = (response.status_code, response.reason_phrase)
+            result.status_code, result.status_reason = status
+            result.content_type = content_type
+            if not content_type.startswith("text/event-stream"):
+                await response.aread()
+                res_json = json_loads(response.content)
+                answer = res_json.get("answer", "<EMPTY>")
+                self._store_cache(q_emb, chat_history_for_ml, answer)
+                yield (answer, *status)
+                result.res_json = res_json
+                result.ok = True
+                return
+
+            parts: List[str] = []
+            res_json: Dict = {}
+            async for line in response.aiter_lines():
+                if line.startswith("data:"):
+                    event = json_loads(line[5:])
+                    parts.append(event.get("answer", ""))
+                    res_json.update(event)
+                    yield (parts[-1], *status)
+
+            answer = res_json["answer"] = "".join(parts)
+            self._store_cache(q_emb, chat_history_for_ml, answer)
+            result.res_json = res_json
+            result.ok = True
+
+        except json.JSONDecodeError as e:
+            log_message(f"Failed to parse JSON response: {e}", level="error")
+
+        except httpx.HTTPError as e:
+            log_message(f"error: {e}", level="error")
+
+        finally:
+            await response.aclose()
+
+    async def asimulate_stream(
+        self,
+        msg: str,
+        chat_history_for_ml: List[Dict[str, str]],
+        delay: float = 0.01,
+        step: int = 8,
+        result: Optional[AIStreamResult] = None,
+    ) -> AsyncGenerator[Tuple[str, int, str], None]:
+        """Calls the API without streaming, then replays the answer `step` characters at a time.
+
+        Args:
+            msg (str): User question message
+            chat_history_for_ml (List[Dict[str, str | Dict]]): ChatHistory Json for MLAPI. The Format is `{ "inputs": {"question": msg}, "outputs": bot_message }`
+            delay (float): Processing Interval of output message, per character
+            step (int): Number of characters per replayed chunk
+            result (Optional[AIStreamResult]): Filled in with the response JSON once the whole answer was replayed.
+
+        Returns:
+            (AsyncGenerator[Tuple[str, int, str], None]): (answer chunk, status_code, status_reason_msg)
+        """
+        api_result = await self.aexec_api(
+            msg=msg, chat_history_for_ml=chat_history_for_ml
+        )
+        if not api_result or api_result[0] is None:
+            return
+
+        res_json, res_status_code, res_status_reason = api_result
+        bot_message: str = res_json.get("answer", "<EMPTY>")
+
+        # NOTE: intetionally run `for` Loop to behave like streaming Chat,
+        #       a few characters per frame keeps it smooth at 1/step the cost
+        for i in range(0, len(bot_message), step):
+            await asyncio.sleep(delay * step)
+            yield bot_message[i : i + step], res_status_code, res_status_reason
+
+        if result is not None:
+            result.res_json = res_json
+            result.status_code = res_status_code
+            result.status_reason = res_status_reason
+            result.ok = True
+
+    @staticmethod
+    async def _prefetch(
+        stream: AsyncGenerator[Tuple[str, int, str], None], maxsize: int = 64
+    ) -> AsyncGenerator[Tuple[str, int, str], None]:
+        """Runs `stream` in its own task and hands its chunks over through a queue.
+
+        The pacing sleeps / network reads of the stream then carry on while the
+        caller is busy building and yielding Gradio frames.
+
+        Args:
+            stream (AsyncGenerator[Tuple[str, int, str], None]): Stream from `aexec_api_stream()` or `asimulate_stream()`.
+            maxsize (int): Maximum number of chunks buffered ahead of the caller.
+
+        Returns:
+            (AsyncGenerator[Tuple[str, int, str], None]): The chunks of `stream`, in order.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+        async def _produce():
+            try:
+                async for chunk in stream:
+                    await queue.put(chunk)
+            except Exception as e:
+                log_message(f"error: {e}", level="error")
+            finally:
+                await stream.aclose()
+
+            # NOTE: not reached when cancelled, nobody is waiting then
+            await queue.put(None)
+
+        producer = asyncio.create_task(_produce())
+        try:
+            while (chunk := await queue.get()) is not None:
+                yield chunk
+        finally:
+            producer.cancel()
+
     @abstractmethod
     def respond_simple(
         self,
@@ -207,13 +889,14 @@ class BaseChatApp(ABC):
         ...
 
     @abstractmethod
-    def respond_stream(
+    async def respond_stream(
         self,
         msg: str,
         chat_history: List[Dict[str, str]],
         chat_history_for_ml: List[Dict[str, str]],
         delay: float = 0.01,
-    ) -> Generator[AISimpleResponse, None, None]:
+        simulate_stream: bool = False,
+    ) -> AsyncGenerator[AISimpleResponse, None]:
         """Processes Non-Streaming chat messages in Gradio chatbot. This method must be implemented by subclasses.
 
         Args:
@@ -227,8 +910,11 @@ class BaseChatApp(ABC):
                 The Format is `[ {"inputs": {"question": "<USER MESSAGE1>"}, "outputs": "<RESPONSE MESSAGE1>"},
                     {"inputs": {"question": "<USER MESSAGE2>"}, "outputs": "<RESPONSE MESSAGE2>"},・・・]`
 
+            delay (float): Processing Interval of output message, only used when `simulate_stream` is True.
+            simulate_stream (bool): Replay a non-streaming API answer character by character instead of streaming it from the endpoint.
+
         Returns:
-            (Generator[AISimpleResponse, None]): The updated message, chat history, and ML chat history.
+            (AsyncGenerator[AISimpleResponse, None]): The updated message, chat history, and ML chat history.
         """
 
         ...
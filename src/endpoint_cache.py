@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+CACHE_DIR = Path.home() / ".cache" / "azuremlchat"
+
+
+def cache_path(
+    subscription_id: str,
+    resource_group_name: str,
+    workspace_name: str,
+    endpoint_name: str,
+) -> Path:
+    """Function to get the cache file of an endpoint
+
+    Workspaces and endpoints of the same name in another subscription or
+    resource group (e.g. dev and prod) get their own file.
+
+    Args:
+        subscription_id (str): Azure subscription ID.
+        resource_group_name (str): Name of the resource group.
+        workspace_name (str): Name of the Machine Learning Workspace.
+        endpoint_name (str): Name of the online endpoint.
+
+    Returns:
+        Path: `~/.cache/azuremlchat/<workspace>_<endpoint>_<hash of subscription and resource group>.json`
+    """
+    scope = hashlib.sha256(
+        f"{subscription_id}/{resource_group_name}".encode()
+    ).hexdigest()[:12]
+    return CACHE_DIR / f"{workspace_name}_{endpoint_name}_{scope}.json"
+
+
+def load(path: Path, ttl: float = 3600) -> Optional[Dict]:
+    """Loads cached endpoint info if it is younger than `ttl` seconds.
+
+    Args:
+        path (Path): The cache file.
+        ttl (float): Maximum age of the cache in seconds.
+
+    Returns:
+        Optional[Dict]: `{"url": ..., "auth_mode": ..., "key": ..., "ts": ...}`, or None when missing or expired.
+    """
+    try:
+        with path.open(encoding="utf-8") as fi:
+            data = json.load(fi)
+    except (OSError, ValueError):
+        return None
+
+    if time.time() - data.get("ts", 0) > ttl:
+        return None
+
+    return data
+
+
+def save(path: Path, data: Dict) -> None:
+    """Saves endpoint info, readable by the current user only since it holds the endpoint key.
+
+    NOTE: the 0600 mode only applies on POSIX, on Windows the file gets the
+    default ACL of the user profile directory.
+
+    A `ts` already in `data` is kept, so re-saving doesn't extend the cache lifetime.
+
+    Args:
+        path (Path): The cache file.
+        data (Dict): Endpoint info to cache.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as fo:
+        json.dump({"ts": time.time(), **data}, fo)
+    os.chmod(path, 0o600)
+
+
+def invalidate(path: Path) -> None:
+    """Removes the cache file, e.g. after the endpoint rejected the cached key.
+
+    Args:
+        path (Path): The cache file.
+    """
+    path.unlink(missing_ok=True)
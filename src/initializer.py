@@ -1,11 +1,14 @@
-﻿from azure.ai.ml import MLClient
-from azure.identity import DefaultAzureCredential
+﻿from typing import TYPE_CHECKING
+
 from dotenv import find_dotenv, load_dotenv
 
 from src.utils import get_env_variable, log_message
 
+if TYPE_CHECKING:
+    from azure.ai.ml import MLClient
+
 
-def initialize_client(filename=".env") -> MLClient:
+def initialize_client(filename=".env") -> "MLClient":
     """Function to initialize MLClient / Endpoint_Name / Deployment_Name from .env file
 
     Returns:
@@ -25,6 +28,10 @@ def initialize_client(filename=".env") -> MLClient:
 
     log_message("Getting MLWorkspace info...")
 
+    # NOTE: the Azure SDK is slow to import, only load it when it's needed
+    from azure.ai.ml import MLClient
+    from azure.identity import DefaultAzureCredential
+
     ml_client = MLClient(
         credential=DefaultAzureCredential(),
         subscription_id=sub_id,
@@ -0,0 +1,208 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Protocol
+
+import numpy as np
+
+
+class Embedder(Protocol):
+    """Represent a text embedding model usable by SemanticCache"""
+
+    model_name: str
+
+    def embed(self, text: str) -> np.ndarray: ...
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray: ...
+
+
+class SentenceTransformerEmbedder:
+    def __init__(
+        self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"
+    ) -> None:
+        """Local embedding model backed by `sentence-transformers`.
+
+        Args:
+            model_name (str): Name of the sentence-transformers model.
+        """
+        # NOTE: optional dependency, only needed for the semantic cache
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self._model = SentenceTransformer(model_name)
+
+    def embed(self, text: str) -> np.ndarray:
+        return self._model.encode(text, normalize_embeddings=True)
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        return self._model.encode(texts, normalize_embeddings=True)
+
+
+class CachedEmbedder:
+    def __init__(self, inner: Embedder, cap: int = 10_000) -> None:
+        """LRU cache in front of an embedding model, so repeated prompts skip it.
+
+        Args:
+            inner (Embedder): The wrapped embedding model.
+            cap (int): Maximum number of cached embeddings.
+        """
+        self.model_name = inner.model_name
+        self._inner = inner
+        self._cap = cap
+        self._cache: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        # NOTE: lookups run in worker threads (asyncio.to_thread), guard the
+        #       LRU order against concurrent move_to_end()/popitem()
+        self._lock = threading.Lock()
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.sha256(
+            (self.model_name + "\0" + text).encode()
+        ).digest()
+
+    def _get(self, key: bytes) -> Optional[np.ndarray]:
+        with self._lock:
+            if (vec := self._cache.get(key)) is not None:
+                self._cache.move_to_end(key)
+            return vec
+
+    def _put(self, key: bytes, vec: np.ndarray) -> None:
+        with self._lock:
+            self._cache[key] = vec
+            if len(self._cache) > self._cap:
+                self._cache.popitem(last=False)
+
+    def embed(self, text: str) -> np.ndarray:
+        key = self._key(text)
+        if (vec := self._get(key)) is not None:
+            return vec
+
+        vec = self._inner.embed(text)
+        self._put(key, vec)
+        return vec
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """Embeds `texts`, sending only the cache misses to the model in one batch.
+
+        Args:
+            texts (List[str]): Texts to embed.
+
+        Returns:
+            (np.ndarray): One embedding per text, in input order.
+        """
+        keys = [self._key(text) for text in texts]
+        vecs: List[Optional[np.ndarray]] = []
+        misses: List[int] = []
+        for i, key in enumerate(keys):
+            if (vec := self._get(key)) is None:
+                misses.append(i)
+            vecs.append(vec)
+
+        if misses:
+            embedded = self._inner.embed_batch([texts[i] for i in misses])
+            for i, vec in zip(misses, embedded):
+                vecs[i] = vec
+                self._put(keys[i], vec)
+
+        return np.stack(vecs)
+
+
+class SemanticCache:
+    def __init__(
+        self, max_size: int = 1024, tau: float = 0.85, ttl: float = 300.0
+    ) -> None:
+        """Answer cache looked up by cosine similarity of query embeddings.
+
+        Vectors are L2-normalized and kept in one matrix, so a lookup is one
+        inner-product scan (same as a flat IP index). Once full, the oldest
+        slot is overwritten.
+
+        Args:
+            max_size (int): Maximum number of cached answers.
+            tau (float): Minimum cosine similarity to count as a hit.
+            ttl (float): Seconds a cached answer stays valid.
+        """
+        self._max_size = max_size
+        self._tau = tau
+        self._ttl = ttl
+
+        self._vectors: Optional[np.ndarray] = None
+        self._namespaces: List[str] = [""] * max_size
+        self._answers: List[str] = [""] * max_size
+        self._expires = np.zeros(max_size)
+        self._size = 0
+        self._next = 0
+        # NOTE: get() runs in worker threads while put() runs on the event
+        #       loop, a put() between reads would misalign the arrays
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(emb: np.ndarray) -> np.ndarray:
+        emb = np.asarray(emb, dtype=np.float32).ravel()
+        norm = np.linalg.norm(emb)
+        return emb / norm if norm else emb
+
+    def get(
+        self,
+        query_emb: np.ndarray,
+        namespace: str = "",
+        tau: Optional[float] = None,
+    ) -> Optional[str]:
+        """Returns the cached answer closest to `query_emb`, if similar enough.
+
+        Args:
+            query_emb (np.ndarray): Embedding of the user question.
+            namespace (str): Conversation context the answer must belong to.
+            tau (Optional[float]): Overrides the default similarity threshold.
+
+        Returns:
+            (Optional[str]): Cached answer, or None on a miss.
+        """
+        query = self._normalize(query_emb)
+        with self._lock:
+            size = self._size
+            if not size:
+                return None
+
+            scores = self._vectors[:size] @ query
+            scores[self._expires[:size] < time.monotonic()] = -1.0
+            for i in np.argsort(scores)[::-1]:
+                if scores[i] < (self._tau if tau is None else tau):
+                    break
+                if self._namespaces[i] == namespace:
+                    return self._answers[i]
+
+        return None
+
+    def put(
+        self,
+        query_emb: np.ndarray,
+        answer: str,
+        namespace: str = "",
+        ttl: Optional[float] = None,
+    ) -> None:
+        """Caches `answer` for the question embedded as `query_emb`.
+
+        Args:
+            query_emb (np.ndarray): Embedding of the user question.
+            answer (str): API answer to serve on later hits.
+            namespace (str): Conversation context the answer belongs to.
+            ttl (Optional[float]): Overrides the default time to live.
+        """
+        emb = self._normalize(query_emb)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros(
+                    (self._max_size, emb.shape[0]), dtype=np.float32
+                )
+
+            i = self._next
+            self._vectors[i] = emb
+            self._namespaces[i] = namespace
+            self._answers[i] = answer
+            self._expires[i] = time.monotonic() + (
+                self._ttl if ttl is None else ttl
+            )
+
+            self._next = (i + 1) % self._max_size
+            self._size = min(self._size + 1, self._max_size)
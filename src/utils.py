@@ -1,11 +1,111 @@
-﻿import json
+﻿import functools
+import json
 import os
+import sys
 import time
 import traceback
+from typing import TYPE_CHECKING, Iterable, List, TextIO
 
-from azure.ai.ml import MLClient
-from rich import print
-from rich.tree import Tree
+if TYPE_CHECKING:
+    from azure.ai.ml import MLClient
+
+# NOTE: the one place picking the fastest available JSON library, once at
+#       import. `json_dumps`/`json_loads` are compact for the API calls,
+#       `_fast_dumps` is indented for the HTTP log. Decoding falls back to
+#       the stdlib, so parse errors are always `json.JSONDecodeError`
+try:
+    import orjson
+
+    # NOTE: numpy arrays in scoring payloads are serialized without .tolist()
+    _ORJSON_OPTS = (
+        orjson.OPT_INDENT_2
+        | orjson.OPT_NON_STR_KEYS
+        | orjson.OPT_SERIALIZE_NUMPY
+    )
+
+    json_dumps, json_loads = orjson.dumps, orjson.loads
+
+    def _fast_dumps(obj) -> str:
+        return orjson.dumps(obj, option=_ORJSON_OPTS).decode("utf-8")
+
+except ImportError:
+    json_loads = json.loads
+
+    try:
+        import ujson
+
+        def json_dumps(obj) -> bytes:
+            return ujson.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+        def _fast_dumps(obj) -> str:
+            return ujson.dumps(obj, indent=2, ensure_ascii=False)
+
+    except ImportError:
+
+        def json_dumps(obj) -> bytes:
+            return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+        def _fast_dumps(obj) -> str:
+            return json.dumps(obj, indent=2, ensure_ascii=False)
+
+# NOTE: same names and numeric severities as the `logging` module, e.g.
+#       LOG_LEVEL=ERROR or LOG_LEVEL=40 only shows errors
+LEVEL_INFO = 20
+LEVEL_ERROR = 40
+_LEVELS = {"info": LEVEL_INFO, "error": LEVEL_ERROR}
+_LEVEL_NAMES = {"debug": 10, "warning": 30, "critical": 50, **_LEVELS}
+
+
+def _parse_level(value: str) -> int:
+    """Parses LOG_LEVEL, falling back to INFO instead of failing at import."""
+    if (level := _LEVEL_NAMES.get(value.strip().lower())) is not None:
+        return level
+    try:
+        return int(value)
+    except ValueError:
+        sys.stderr.write(
+            f"WARNING: invalid LOG_LEVEL {value!r}, using INFO instead\n"
+        )
+        return LEVEL_INFO
+
+
+_LEVEL = _parse_level(os.getenv("LOG_LEVEL", str(LEVEL_INFO)))
+
+# NOTE: rich only pays off on a color terminal, pipes and files (CI, redirects)
+#       get plain text through one sys.stdout.write per message (and rich
+#       isn't even imported then)
+_USE_RICH = sys.stdout.isatty() and os.getenv("NO_COLOR") is None
+if _USE_RICH:
+    from rich import print as _emit
+
+    _RED, _RED_END, _CYAN, _CYAN_END = "[red]", "[/red]", "[cyan]", "[/cyan]"
+else:
+    _RED = _RED_END = _CYAN = _CYAN_END = ""
+
+    def _emit(text: str) -> None:
+        sys.stdout.write(text + "\n")
+
+
+# NOTE: the colored severity prefixes never change, only fill in the
+#       timestamp and message
+_ERR_PREFIX = _RED + "%s - ERROR:" + _RED_END + " %s"
+_INFO_PREFIX = _CYAN + "%s - INFO:" + _CYAN_END + " %s"
+
+# NOTE: bursts of messages mostly land in the same second, reuse its string
+_last_ts_sec = 0
+_last_ts_str = ""
+
+
+def log_enabled(level: str = "info") -> bool:
+    """Checks if messages of the severity level are logged, so callers can skip building them.
+
+    Args:
+        level (str): The severity level of the message ('info' or 'error').
+
+    Returns:
+        bool: True if `log_message` would print the message.
+    """
+    return _LEVELS.get(level, LEVEL_INFO) >= _LEVEL
 
 
 def log_message(message: str, level: str = "info") -> None:
@@ -15,12 +115,25 @@ def log_message(message: str, level: str = "info") -> None:
         message (str): The message to log.
         level (str): The severity level of the message ('info' or 'error').
     """
-    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    if not log_enabled(level):
+        return
+
+    global _last_ts_sec, _last_ts_str
+    now = int(time.time())
+    if now != _last_ts_sec:
+        _last_ts_sec = now
+        _last_ts_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+    timestamp = _last_ts_str
     if level == "error":
-        print(f"[red]{timestamp} - ERROR:[/red] {message}")
-        print(f"[red]{traceback.format_exc()}[/red]")  # Print stack trace
+        msg = _ERR_PREFIX % (timestamp, message)
+        # NOTE: only inside an `except` block, format_exc() would otherwise
+        #       walk the stack just to print "NoneType: None"
+        if sys.exc_info()[0] is not None:
+            # NOTE: one print for message and stack trace, one render/write
+            msg += f"\n{_RED}{traceback.format_exc()}{_RED_END}"
+        _emit(msg)
     else:
-        print(f"[cyan]{timestamp} - INFO:[/cyan] {message}")
+        _emit(_INFO_PREFIX % (timestamp, message))
 
 
 def get_env_variable(var_name: str) -> str:
@@ -35,8 +148,8 @@ def get_env_variable(var_name: str) -> str:
     Raises:
         ValueError: If the environment variable is not found.
     """
-    value = os.getenv(var_name)
-    if not value:
+    value = os.environ.get(var_name)
+    if value is None:
         log_message(
             f"Environment variable {var_name} is missing.", level="error"
         )
@@ -47,7 +160,7 @@ def get_env_variable(var_name: str) -> str:
 
 
 def show_ml_info(
-    ml_client: MLClient,
+    ml_client: "MLClient",
     endpoint_url: str,
     deployment_name: str,
 ):
@@ -58,24 +171,20 @@ def show_ml_info(
         endpoint_name (str): Name of the online endpoint.
         deployment_name (str): Name of the deployment in the endpoint.
     """
-    tree = Tree(f"[cyan]Subscription[/cyan]: {ml_client.subscription_id}")
-
-    tree.add(
-        f"[cyan]Resource Group[/cyan]: {ml_client.resource_group_name}"
-    ).add(
-        f"[cyan]Machine Learning Workspace[/cyan]: {ml_client.workspace_name}"
-    ).add(
-        f"[cyan]Managed Online Endpoint[/cyan]: {endpoint_url}"
-    ).add(
-        f"[cyan]Deployment[/cyan]: {deployment_name}"
-    )
-
     log_message("**Workspace Info**")
-    print(tree)
+    _emit(
+        f"{_CYAN}Subscription{_CYAN_END}: {ml_client.subscription_id}\n"
+        f"└─ {_CYAN}Resource Group{_CYAN_END}: "
+        f"{ml_client.resource_group_name}\n"
+        f"   └─ {_CYAN}Machine Learning Workspace{_CYAN_END}: "
+        f"{ml_client.workspace_name}\n"
+        f"      └─ {_CYAN}Managed Online Endpoint{_CYAN_END}: "
+        f"{endpoint_url}\n"
+        f"         └─ {_CYAN}Deployment{_CYAN_END}: {deployment_name}"
+    )
 
 
-def format_http_log(call_history: str):
-    return f"""
+_HTTP_LOG_PREFIX = """
 <head>
     <!-- Prism.js -->
     <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/prism/1.29.0/themes/prism-tomorrow.min.css">
@@ -86,10 +195,78 @@ def format_http_log(call_history: str):
 </head>
 
 <body>
-    {call_history}
+    """
+_HTTP_LOG_SUFFIX = """
 </body>
         """
 
+# NOTE: HTTP_LOG_ENABLED=0 skips rendering the HTML call log entirely, e.g.
+#       when the log panel isn't shown
+_HTTP_LOG_ENABLED = os.getenv("HTTP_LOG_ENABLED", "1") != "0"
+
+
+def http_log_enabled() -> bool:
+    """Checks if the HTML call log is rendered, so callers can skip building its inputs.
+
+    Returns:
+        bool: False if `HTTP_LOG_ENABLED=0` is set.
+    """
+    return _HTTP_LOG_ENABLED
+
+
+def format_http_log(call_history: str):
+    if not _HTTP_LOG_ENABLED:
+        return ""
+    return _HTTP_LOG_PREFIX + call_history + _HTTP_LOG_SUFFIX
+
+
+def write_http_log(fp: TextIO, entries: Iterable[str]) -> None:
+    """Writes the HTML page of `entries` to `fp` piece by piece, without building it as one string.
+
+    Args:
+        fp (TextIO): Destination, e.g. a file opened in text mode or a StringIO.
+        entries (Iterable[str]): Entries rendered by `create_http_log`.
+    """
+    if not _HTTP_LOG_ENABLED:
+        return
+    fp.write(_HTTP_LOG_PREFIX)
+    for entry in entries:
+        fp.write(entry)
+    fp.write(_HTTP_LOG_SUFFIX)
+
+
+@functools.lru_cache(maxsize=8)
+def _build_static_headers(
+    path: str, protocol: str, host: str, deployment: str, accept: str
+) -> str:
+    # NOTE: constant for a deployment, only rendered once per session
+    return f"""<span class="token request-line"><span class="token method property">POST </span><span class="token request-target url">{path} </span><span class="token http-version property">{protocol}</span></span>
+<span class="token header"><span class="token header-name keyword">Host</span><span class="token punctuation">: </span><span class="token header-value">{host}</span></span>
+<span class="token header"><span class="token header-name keyword">Accept</span><span class="token punctuation">: </span><span class="token header-value">{accept}</span></span>
+<span class="token header"><span class="token header-name keyword">Authorization</span><span class="token punctuation">: </span><span class="token header-value">Bearer &lt; MASKED_APIKey &gt;</span></span>
+<span class="token header"><span class="token header-name keyword">azureml-model-deployment</span><span class="token punctuation">: </span><span class="token header-value">{deployment}</span></span>
+<span class="token header"><span class="token header-name keyword">Content-Type</span><span class="token punctuation">: </span><span class="token header-value">application/json</span></span>"""
+
+
+# NOTE: %-formatted in one C-level pass instead of one f-string field at a time
+_ENTRY_TMPL = """
+<span style="color: orange;">#%s API Request</span>
+<pre class="language-http" tabindex="0">
+%s
+
+%s
+</pre>
+
+<span style="color: orange;">#%s Response</span>
+<pre class="language-http" tabindex="0">
+<span class="token response-status"><span class="token http-version property">HTTP/1.1 </span><span class="token status-code number">%s </span><span class="token reason-phrase string">%s</span></span>
+<span class="token header"><span class="token header-name keyword">Content-Type</span><span class="token punctuation">: </span><span class="token header-value">%s</span></span>
+
+%s
+</pre>
+<hr>
+    """
+
 
 def create_http_log(
     call_count: int,
@@ -98,34 +275,80 @@ def create_http_log(
     joutput: dict,
     res_status_code: int,
     res_status_reason: str,
+    accept: str = "application/json",
+    content_type: str = "application/json",
+    pure_ascii: bool = False,
 ):
-    return f"""
-<span style="color: orange;">#{call_count} API Request</span>
-<pre class="language-http" tabindex="0">
-<span class="token request-line"><span class="token method property">POST </span><span class="token request-target url">{_cls.path} </span><span class="token http-version property">{_cls.protocol}</span></span>
-<span class="token header"><span class="token header-name keyword">Host</span><span class="token punctuation">: </span><span class="token header-value">{_cls.host}</span></span>
-<span class="token header"><span class="token header-name keyword">Accept</span><span class="token punctuation">: </span><span class="token header-value">application/json</span></span>
-<span class="token header"><span class="token header-name keyword">Authorization</span><span class="token punctuation">: </span><span class="token header-value">Bearer &lt; MASKED_APIKey &gt;</span></span>
-<span class="token header"><span class="token header-name keyword">azureml-model-deployment</span><span class="token punctuation">: </span><span class="token header-value">{_cls._deployment_name}</span></span>
-<span class="token header"><span class="token header-name keyword">Content-Type</span><span class="token punctuation">: </span><span class="token header-value">application/json</span></span>
-
-{json.dumps(
-    jinput,
-    indent=4,
-    ensure_ascii=False,
-)}
-</pre>
+    if not _HTTP_LOG_ENABLED:
+        return ""
+    req_headers = _build_static_headers(
+        _cls.path, _cls.protocol, _cls.host, _cls._deployment_name, accept
+    )
+    # NOTE: `pure_ascii` is accepted but ignored, orjson already beats the
+    #       stdlib on ASCII input (indent= disables the stdlib's C encoder)
+    json_in = _fast_dumps(jinput)
+    json_out = _fast_dumps(joutput)
+    return _ENTRY_TMPL % (
+        call_count,
+        req_headers,
+        json_in,
+        call_count,
+        res_status_code,
+        res_status_reason,
+        content_type,
+        json_out,
+    )
+
+
+class HttpLogBuffer:
+    def __init__(self) -> None:
+        """Accumulates rendered HTTP log entries, joining them only when the page is rendered.
+
+        Appending to a list keeps a long session linear, where `+=` on one
+        growing string copies the whole history per call.
+        """
+        self.entries: List[str] = []
+
+    def append(
+        self,
+        call_count: int,
+        _cls,
+        jinput: dict,
+        joutput: dict,
+        res_status_code: int,
+        res_status_reason: str,
+        accept: str = "application/json",
+        content_type: str = "application/json",
+        pure_ascii: bool = False,
+    ) -> None:
+        """Renders one request/response pair with `create_http_log` and buffers it."""
+        if not _HTTP_LOG_ENABLED:
+            return
+        self.entries.append(
+            create_http_log(
+                call_count,
+                _cls,
+                jinput,
+                joutput,
+                res_status_code,
+                res_status_reason,
+                accept=accept,
+                content_type=content_type,
+                pure_ascii=pure_ascii,
+            )
+        )
+
+    def render(self) -> str:
+        """Returns the HTML page of all buffered entries, keeping them."""
+        return format_http_log("".join(self.entries))
+
+    def flush(self) -> str:
+        """Returns the HTML page of all buffered entries and clears the buffer."""
+        html = self.render()
+        self.entries.clear()
+        return html
+
+    def write(self, fp: TextIO) -> None:
+        """Writes the HTML page of all buffered entries to `fp`, see `write_http_log`."""
+        write_http_log(fp, self.entries)
 
-<span style="color: orange;">#{call_count} Response</span>
-<pre class="language-http" tabindex="0">
-<span class="token response-status"><span class="token http-version property">HTTP/1.1 </span><span class="token status-code number">{res_status_code} </span><span class="token reason-phrase string">{res_status_reason}</span></span>
-<span class="token header"><span class="token header-name keyword">Content-Type</span><span class="token punctuation">: </span><span class="token header-value">application/json</span></span>
-
-{json.dumps(
-    joutput,
-    indent=4,
-    ensure_ascii=False,
-)}
-</pre>
-<hr>
-    """